@@ -5,8 +5,11 @@ import numpy as np
 import svgwrite
 import os
 import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import json
-from PIL import Image, ImageTk
+from collections import OrderedDict
+from PIL import Image, ImageOps, ImageTk
 
 # --- 3D IMPORTS ---
 import trimesh
@@ -21,20 +24,81 @@ DEFAULT_DENOISE = 3
 DEFAULT_MIN_BLOB = 100
 DEFAULT_TEMPLATE = "%INPUTFILENAME%-%COLOR%-%INDEX%"
 
-def bgr_to_hex(bgr):
-    return '#{:02x}{:02x}{:02x}'.format(int(bgr[2]), int(bgr[1]), int(bgr[0]))
+# --- PREVIEW CANVAS ---
+PYRAMID_MIN_WIDTH = 256   # Stop halving once a pyramid level drops below this
+RESIZE_DEBOUNCE_MS = 30   # Collapse bursts of <Configure> events
+RESIZE_CACHE_SIZE = 4     # Recently displayed sizes kept as PhotoImages
+HQ_REDRAW_DELAY_MS = 120  # Idle time before the bilinear preview is redone with Lanczos
+
+# --- PROCESSING ---
+ASSIGN_CHUNK_PIXELS = 1 << 14 # Pixels per block in nearest-color assignment (fits in cache)
+UI_POLL_MS = 16               # Worker -> Tk hand-off queue is drained at ~60 Hz
+# Settings snapshotted for each processing run
+PROCESS_CONFIG_KEYS = ("max_width", "max_colors", "denoise_strength", "min_blob_size", "orphaned_blobs", "round_kernel")
 
-def is_bright(bgr):
-    return (bgr[2] * 0.299 + bgr[1] * 0.587 + bgr[0] * 0.114) > 186
+_HEX = [f'{i:02x}' for i in range(256)]
+
+def bgr_to_hex(bgr):
+    return '#' + _HEX[bgr[2]] + _HEX[bgr[1]] + _HEX[bgr[0]]
+
+LUMA_WEIGHTS_BGR = np.array([0.114, 0.587, 0.299])
+
+def luma_bgr(colors):
+    """ Perceived brightness of one BGR color or an (N, 3) array of them. """
+    return np.asarray(colors, dtype=np.float64).reshape(-1, 3) @ LUMA_WEIGHTS_BGR
+
+def is_bright(colors):
+    """ Per-color flag (bool array): light enough to need dark text on top. """
+    return luma_bgr(colors) > 186
+
+def write_json_atomic(path, data, compact=False):
+    """ Writes to a temp file and swaps it in, so a crash never leaves a half-written file. """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        if compact: json.dump(data, f, separators=(',', ':'))
+        else: json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+# Spaghetti labelling where the OpenCV build has it, otherwise block-based BBDT
+CCL_ALGORITHM = getattr(cv2, "CCL_SPAGHETTI", cv2.CCL_BBDT)
+
+def assign_nearest_color(pixels, centers):
+    """ Index of the nearest center for each (N, 3) pixel row, computed block by block. """
+    centers = np.asarray(centers, dtype=np.float32)
+    labels = np.empty(len(pixels), dtype=np.uint8 if len(centers) <= 256 else np.int32)
+    # |x-c|^2 = |x|^2 - 2x.c + |c|^2; |x|^2 is the same for every center, so argmin
+    # only needs |c|^2 - 2x.c (exact in float32 for 8-bit inputs)
+    cc = np.einsum('ij,ij->i', centers, centers)
+    neg_2c = -2.0 * centers.T
+    for start in range(0, len(pixels), ASSIGN_CHUNK_PIXELS):
+        dist = pixels[start:start + ASSIGN_CHUNK_PIXELS].astype(np.float32) @ neg_2c
+        dist += cc
+        labels[start:start + ASSIGN_CHUNK_PIXELS] = np.argmin(dist, axis=1)
+    return labels
+
+def nearest_neighbor_chain(points, start=0):
+    """ Greedy nearest-neighbour walk over (N, k) points from `start`; returns the visiting order. """
+    pts = np.asarray(points, dtype=np.float64)
+    d2 = ((pts[:, None, :] - pts[None, :, :]) ** 2).sum(-1)
+    order = np.empty(len(pts), dtype=np.intp)
+    current = start
+    for step in range(len(pts)):
+        order[step] = current
+        d2[:, current] = np.inf # Visited: never the nearest again
+        current = int(d2[current].argmin())
+    return order
 
 def filter_small_blobs(mask, min_size):
     """ Optimized area filtering using Connected Components (Raster). """
     if min_size <= 0: return mask
-    n, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
-    valid_labels = (stats[:, cv2.CC_STAT_AREA] >= min_size)
-    valid_labels[0] = False 
-    lut = np.zeros(n, dtype=np.uint8)
-    lut[valid_labels] = 255
+    n, labels, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(mask, 8, cv2.CV_32S, CCL_ALGORITHM)
+    lut = (stats[:, cv2.CC_STAT_AREA] >= min_size).astype(np.uint8) * 255
+    lut[0] = 0
+    # Every blob is big enough: the (binary) mask already is the answer, skip the LUT pass
+    if lut[1:].all(): return mask
+    if n <= 256:
+        # Labels fit in uint8: single SIMD pass through OpenCV (table must be 256 long)
+        return cv2.LUT(labels.astype(np.uint8), np.pad(lut, (0, 256 - n)))
     return lut[labels]
 
 class AutoResizingCanvas(tk.Canvas):
@@ -45,27 +109,94 @@ class AutoResizingCanvas(tk.Canvas):
         self.scale_ratio = 1.0
         self.offset_x = 0
         self.offset_y = 0
+        self._pyramid = None # Built on first draw; result tabs that are never opened skip it
+        self._photo_cache = OrderedDict() # (w, h) -> PhotoImage, most recent last
+        self._resize_job = None
+        self._hq_job = None
+        self._pending_size = None
+        self._last_size = None # Displayed (w, h) of the current bitmap
+        self.image_id = None
         self.bind("<Configure>", self.on_resize)
 
+    @staticmethod
+    def _build_pyramid(pil_image):
+        """ Pre-halved copies of the image so resizes sample from a nearby level. """
+        if not pil_image: return []
+        levels = [pil_image]
+        while levels[-1].width >= PYRAMID_MIN_WIDTH:
+            levels.append(levels[-1].reduce(2))
+        return levels
+
+    def _fit(self, canvas_width, canvas_height):
+        """ Scale ratio and displayed size that fit the image inside the canvas. """
+        img_w, img_h = self.pil_image.size
+        ratio = min(canvas_width / img_w, canvas_height / img_h)
+        return ratio, (max(1, int(img_w * ratio)), max(1, int(img_h * ratio)))
+
     def on_resize(self, event):
         if not self.pil_image: return
-        canvas_width = event.width
-        canvas_height = event.height
-        if canvas_width < 10 or canvas_height < 10: return
+        if event.width < 10 or event.height < 10: return
+        self._pending_size = (event.width, event.height)
+        if self._resize_job:
+            self.after_cancel(self._resize_job)
+            self._resize_job = None
+        if self._fit(event.width, event.height)[1] == self._last_size:
+            # Re-layout at the same displayed size: re-centre, nothing to resample
+            self._place(event.width, event.height)
+            return
+        # Debounce: rapid drag events collapse into a single resample
+        self._resize_job = self.after(RESIZE_DEBOUNCE_MS, self._redraw)
 
-        img_w, img_h = self.pil_image.size
-        self.scale_ratio = min(canvas_width / img_w, canvas_height / img_h)
-        
-        new_w = int(img_w * self.scale_ratio)
-        new_h = int(img_h * self.scale_ratio)
-        
-        resized_pil = self.pil_image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        self.displayed_image = ImageTk.PhotoImage(resized_pil)
-        
-        self.delete("all")
+    def _place(self, canvas_width, canvas_height):
+        self.scale_ratio, (new_w, new_h) = self._fit(canvas_width, canvas_height)
         self.offset_x = (canvas_width - new_w) // 2
         self.offset_y = (canvas_height - new_h) // 2
-        self.create_image(self.offset_x, self.offset_y, anchor="nw", image=self.displayed_image)
+        if self.image_id is not None:
+            self.coords(self.image_id, self.offset_x, self.offset_y)
+        return (new_w, new_h)
+
+    def _redraw(self):
+        self._resize_job = None
+        key = self._place(*self._pending_size)
+        self._last_size = key
+        
+        if self._hq_job:
+            self.after_cancel(self._hq_job)
+            self._hq_job = None
+        
+        if key in self._photo_cache:
+            self._photo_cache.move_to_end(key)
+            self._show(self._photo_cache[key])
+        else:
+            # Cheap bilinear while the user is still dragging; Lanczos once they stop
+            self._show(ImageTk.PhotoImage(self._resample(key, Image.Resampling.BILINEAR)))
+            self._hq_job = self.after(HQ_REDRAW_DELAY_MS, self._redraw_lanczos, key)
+
+    def _redraw_lanczos(self, key):
+        self._hq_job = None
+        self._photo_cache[key] = ImageTk.PhotoImage(self._resample(key, Image.Resampling.LANCZOS))
+        if len(self._photo_cache) > RESIZE_CACHE_SIZE:
+            self._photo_cache.popitem(last=False)
+        self._show(self._photo_cache[key])
+
+    def _resample(self, size, method):
+        if self._pyramid is None: self._pyramid = self._build_pyramid(self.pil_image)
+        # Smallest pyramid level that is still at least as wide as the target
+        source = next((lvl for lvl in reversed(self._pyramid) if lvl.width >= size[0]), self.pil_image)
+        return source.resize(size, method)
+
+    def _show(self, photo):
+        self.displayed_image = photo
+        if self.image_id is None:
+            self.image_id = self.create_image(self.offset_x, self.offset_y, anchor="nw", image=photo)
+        else:
+            # Swap the bitmap on the existing item instead of churning canvas items
+            self.itemconfig(self.image_id, image=photo)
+
+    def destroy(self):
+        if self._resize_job: self.after_cancel(self._resize_job)
+        if self._hq_job: self.after_cancel(self._hq_job)
+        super().destroy()
 
     def get_image_coordinates(self, screen_x, screen_y):
         if not self.pil_image: return None
@@ -96,8 +227,15 @@ class CamoStudioApp:
             "min_blob_size": tk.IntVar(value=DEFAULT_MIN_BLOB),
             "filename_template": tk.StringVar(value=DEFAULT_TEMPLATE),
             "smoothing": tk.DoubleVar(value=DEFAULT_SMOOTHING),
-            "orphaned_blobs": tk.BooleanVar(value=False) 
+            "orphaned_blobs": tk.BooleanVar(value=False),
+            "round_kernel": tk.BooleanVar(value=False) # Ellipse instead of the faster separable rect
         }
+        # Plain-Python mirror of the processing settings, kept current by traces,
+        # so trigger_process snapshots them without a Tcl round-trip per value
+        self._config_values = {}
+        for key in PROCESS_CONFIG_KEYS:
+            self._config_values[key] = self.config[key].get()
+            self.config[key].trace_add("write", lambda *_, key=key: self._on_config_var_write(key))
         
         # 3D Export Vars
         self.exp_units = tk.StringVar(value="mm")
@@ -115,16 +253,27 @@ class CamoStudioApp:
         self.current_base_name = "camo"
         
         # State
-        self.picked_colors = [] 
+        self.picked_colors = np.empty((0, 3), dtype=np.uint8) # One BGR row per picked color
+        self._picked_set = set() # O(1) duplicate check for picked_colors
         self.layer_vars = []
         self.select_vars = [] 
+        # NumPy mirrors of layer_vars / select_vars, kept current by Tk traces
+        self._layer_ids = np.zeros(0, dtype=np.int32)
+        self._select = np.zeros(0, dtype=bool)
+        self._var_slots = {} # Tcl variable name -> list index
         self.bulk_target_layer = tk.IntVar(value=1)
         self.last_select_index = -1 
         self.processed_data = None 
-        self.preview_images = {}
+        self._preview_cache = {} # "All" / layer index -> PIL preview, layers built on first view
+        self._lazy_tabs = {} # Result tab widget name -> layer index, until its canvas is built
+        self._contour_cache = {} # (id(mask), smooth) -> (mask, simplified contours), shared by 2D/3D export
+        self._preproc_cache = None # ((max_w, denoise), source image, resized + blurred image) of the last run
+        self._scroll_job = None
+        self._ui_queue = queue.Queue() # (func, args, kwargs) posted by worker threads, run on the Tk thread
 
         self._create_ui()
         self._bind_shortcuts()
+        self._pump_ui_queue()
         
         # --- 4. Bind Close Event to Save ---
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
@@ -178,12 +327,64 @@ class CamoStudioApp:
             "last_directory": self.last_opened_dir
         }
         try:
-            with open(self.settings_file, 'w') as f:
-                json.dump(data, f, indent=4)
+            write_json_atomic(self.settings_file, data)
             print("Settings saved.")
         except Exception as e:
             print(f"Failed to save settings: {e}")
 
+    def _new_layer_var(self, value):
+        var = tk.IntVar(value=value)
+        var.trace_add("write", self._on_layer_var_write)
+        return var
+
+    def _new_select_var(self, value=False):
+        var = tk.BooleanVar(value=value)
+        var.trace_add("write", self._on_select_var_write)
+        return var
+
+    def _on_layer_var_write(self, name, *_):
+        i = self._var_slots.get(name)
+        if i is None: return
+        try:
+            self._layer_ids[i] = self.layer_vars[i].get()
+        except (tk.TclError, ValueError):
+            pass # Spinbox mid-edit (empty or non-numeric); keep the last valid id
+
+    def _on_config_var_write(self, key):
+        try:
+            self._config_values[key] = self.config[key].get()
+        except (tk.TclError, ValueError):
+            pass # Spinbox mid-edit; keep the last valid value
+
+    def _on_select_var_write(self, name, *_):
+        i = self._var_slots.get(name)
+        if i is not None: self._select[i] = self.select_vars[i].get()
+
+    def _sync_var_shadows(self, layer_ids=None, select=None):
+        """ Installs the NumPy mirrors after layer_vars / select_vars are rebuilt or reordered. """
+        n = len(self.layer_vars)
+        self._layer_ids = np.zeros(n, dtype=np.int32) if layer_ids is None else np.asarray(layer_ids, dtype=np.int32)
+        self._select = np.zeros(n, dtype=bool) if select is None else np.asarray(select, dtype=bool)
+        self._var_slots = {str(v): i for i, v in enumerate(self.layer_vars)}
+        self._var_slots.update({str(v): i for i, v in enumerate(self.select_vars)})
+
+    def _post(self, func, *args, **kwargs):
+        """ Thread-safe: queues func(*args, **kwargs) to run on the Tk thread. """
+        self._ui_queue.put((func, args, kwargs))
+
+    def _pump_ui_queue(self):
+        """ Runs everything workers posted since the last tick; one Tk wakeup per frame. """
+        while True:
+            try:
+                func, args, kwargs = self._ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                print(e)
+        self.root.after(UI_POLL_MS, self._pump_ui_queue)
+
     def on_close(self):
         """Handler for window close event."""
         self.save_app_settings()
@@ -227,6 +428,7 @@ class CamoStudioApp:
 
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(expand=True, fill="both", padx=10, pady=5)
+        self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
         
         self.tab_main = tk.Frame(self.notebook)
         self.notebook.add(self.tab_main, text="Input / Preview")
@@ -264,7 +466,7 @@ class CamoStudioApp:
         self.swatch_scrollbar = ttk.Scrollbar(self.swatch_container, orient="vertical", command=self.swatch_canvas.yview)
         
         self.swatch_list_frame = tk.Frame(self.swatch_canvas, bg="#f0f0f0")
-        self.swatch_list_frame.bind("<Configure>", lambda e: self.swatch_canvas.configure(scrollregion=self.swatch_canvas.bbox("all")))
+        self.swatch_list_frame.bind("<Configure>", lambda e: self._schedule_scroll_update())
         self.swatch_window = self.swatch_canvas.create_window((0, 0), window=self.swatch_list_frame, anchor="nw")
         self.swatch_canvas.bind("<Configure>", lambda e: self.swatch_canvas.itemconfig(self.swatch_window, width=e.width))
         self.swatch_canvas.configure(yscrollcommand=self.swatch_scrollbar.set)
@@ -292,6 +494,15 @@ class CamoStudioApp:
         self.lbl_status = tk.Label(self.root, text="Ready.", anchor="w")
         self.lbl_status.pack(side=tk.BOTTOM, fill=tk.X)
 
+    def _schedule_scroll_update(self):
+        # Rebuilding N swatches fires N <Configure> events; recompute the scrollregion once
+        if self._scroll_job: self.root.after_cancel(self._scroll_job)
+        self._scroll_job = self.root.after(16, self._do_scroll_update)
+
+    def _do_scroll_update(self):
+        self._scroll_job = None
+        self.swatch_canvas.configure(scrollregion=self.swatch_canvas.bbox("all"))
+
     def open_config_window(self, event=None):
         top = tk.Toplevel(self.root)
         top.title("Properties")
@@ -305,6 +516,7 @@ class CamoStudioApp:
         tk.Entry(form, textvariable=self.config["max_colors"]).grid(row=row, column=1, sticky="ew", pady=5); row+=1
         tk.Label(form, text="Denoise Strength:").grid(row=row, column=0, sticky="w")
         tk.Scale(form, from_=0, to=20, orient=tk.HORIZONTAL, variable=self.config["denoise_strength"]).grid(row=row, column=1, sticky="ew", pady=5); row+=1
+        tk.Checkbutton(form, text="Round Denoise Kernel (Slower)", variable=self.config["round_kernel"]).grid(row=row, column=1, sticky="w"); row+=1
         tk.Label(form, text="Path Smoothing:").grid(row=row, column=0, sticky="w")
         tk.Scale(form, from_=0.0001, to=0.005, resolution=0.0001, orient=tk.HORIZONTAL, variable=self.config["smoothing"]).grid(row=row, column=1, sticky="ew", pady=5); row+=1
         tk.Label(form, text="Lower = More Detail. Higher = Smoother.", font=("Arial", 8), fg="gray").grid(row=row, column=1, sticky="w"); row+=1
@@ -366,7 +578,7 @@ class CamoStudioApp:
 
     def reset_project(self):
         """Clears all data and UI to start fresh."""
-        if self.picked_colors and not messagebox.askyesno("New Project", "Discard current changes?"):
+        if len(self.picked_colors) and not messagebox.askyesno("New Project", "Discard current changes?"):
             return
         
         self.original_image_path = None
@@ -374,12 +586,15 @@ class CamoStudioApp:
         self.current_base_name = "camo"
         
         # Clear Data
-        self.picked_colors = []
+        self.picked_colors = np.empty((0, 3), dtype=np.uint8)
+        self._picked_set = set()
         self.layer_vars = []
         self.select_vars = []
+        self._sync_var_shadows()
         self.last_select_index = -1
         self.processed_data = None
-        self.preview_images = {}
+        self._preview_cache = {}
+        self._preproc_cache = None
         
         # Clear UI
         self.update_pick_ui()
@@ -388,8 +603,7 @@ class CamoStudioApp:
             self.main_canvas = None
         
         # Remove extra tabs
-        for tab in self.notebook.tabs():
-            if tab != str(self.tab_main): self.notebook.forget(tab)
+        self._clear_result_tabs()
             
         # Show Open Button
         self.btn_main_load.place(relx=0.5, rely=0.5, anchor="center")
@@ -412,9 +626,16 @@ class CamoStudioApp:
 
         self.original_image_path = path
         self.current_base_name = os.path.splitext(os.path.basename(path))[0]
-        self.cv_original_full = cv2.imread(path)
-        rgb_img = cv2.cvtColor(self.cv_original_full, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(rgb_img)
+        # Decode once with PIL (the display image); OpenCV gets its own contiguous BGR copy
+        pil_img = Image.open(path)
+        ImageOps.exif_transpose(pil_img, in_place=True) # cv2.imread honoured EXIF rotation too
+        if pil_img.mode.startswith("I"):
+            # 16-bit greyscale PNG: scale to 8 bits like imread does (convert() alone would clip)
+            pil_img = pil_img.convert("I").point(lambda v: v / 256).convert("L")
+        if pil_img.mode != "RGB": pil_img = pil_img.convert("RGB")
+        # Contiguous, not a [..., ::-1] view: cv2 would copy a negative-stride array on every call
+        self.cv_original_full = cv2.cvtColor(np.asarray(pil_img), cv2.COLOR_RGB2BGR)
+        self._preproc_cache = None # Let the previous image's arrays go now, not at the next run
         
         # Hide the center button
         self.btn_main_load.place_forget()
@@ -435,15 +656,12 @@ class CamoStudioApp:
             messagebox.showwarning("Warning", "No image loaded to save.")
             return
 
-        # Sanitize colors: Convert numpy.uint8 to standard python int
-        sanitized_colors = [tuple(int(x) for x in c) for c in self.picked_colors]
-
         data = {
             "version": "1.0",
             "image_path": self.original_image_path,
             "config": {k: v.get() for k, v in self.config.items()},
-            "colors": sanitized_colors, 
-            "layers": [v.get() for v in self.layer_vars],
+            "colors": self.picked_colors.tolist(), 
+            "layers": self._layer_ids.tolist(),
             "3d_export": {
                 "units": self.exp_units.get(),
                 "width": self.exp_width.get(),
@@ -458,14 +676,13 @@ class CamoStudioApp:
         if path:
             self.last_opened_dir = os.path.dirname(path) # Remember this dir
             try:
-                with open(path, 'w') as f:
-                    json.dump(data, f, indent=4)
+                write_json_atomic(path, data, compact=True) # Palettes can run to hundreds of colors
                 self.lbl_status.config(text=f"Project saved to {os.path.basename(path)}")
             except Exception as e:
                 messagebox.showerror("Save Error", str(e))
 
     def load_project_json(self):
-        if self.picked_colors and not messagebox.askyesno("Open Project", "Discard current changes?"):
+        if len(self.picked_colors) and not messagebox.askyesno("Open Project", "Discard current changes?"):
             return
 
         path = filedialog.askopenfilename(initialdir=self.last_opened_dir, filetypes=[("Camo Project", "*.json")])
@@ -498,16 +715,14 @@ class CamoStudioApp:
                 self.exp_invert.set(ex.get("invert", True))
 
             # 4. Restore Palette & Layers
-            self.picked_colors = [tuple(c) for c in data.get("colors", [])]
+            self.picked_colors = np.array(data.get("colors", []), dtype=np.uint8).reshape(-1, 3)
+            self._picked_set = set(map(tuple, self.picked_colors.tolist()))
             saved_layers = data.get("layers", [])
             
-            self.layer_vars = []
-            self.select_vars = []
-            
-            for i in range(len(self.picked_colors)):
-                lid = saved_layers[i] if i < len(saved_layers) else 1
-                self.layer_vars.append(tk.IntVar(value=lid))
-                self.select_vars.append(tk.BooleanVar(value=False))
+            layer_ids = [saved_layers[i] if i < len(saved_layers) else 1 for i in range(len(self.picked_colors))]
+            self.layer_vars = [self._new_layer_var(lid) for lid in layer_ids]
+            self.select_vars = [self._new_select_var() for _ in layer_ids]
+            self._sync_var_shadows(layer_ids)
                 
             self.update_pick_ui()
             self.lbl_status.config(text=f"Project loaded: {os.path.basename(path)}")
@@ -520,55 +735,70 @@ class CamoStudioApp:
             messagebox.showinfo("Info", "Load an image first.")
             return
             
-        if self.picked_colors:
+        if len(self.picked_colors):
             if not messagebox.askyesno("YOLO Mode", "This will replace your current palette. Continue?"):
                 return
 
-        self.picked_colors = []
-        self.layer_vars = []
-        self.select_vars = []
-        
-        img = self.cv_original_full.copy()
-        max_analysis_w = 300 
-        h, w = img.shape[:2]
-        if w > max_analysis_w:
-            scale = max_analysis_w / w
-            img = cv2.resize(img, (max_analysis_w, int(h * scale)), interpolation=cv2.INTER_AREA)
+        self.lbl_status.config(text="YOLO Mode: Scanning colors...")
+        self.progress['mode'] = 'indeterminate'
+        self.progress.start(10)
+        threading.Thread(target=self.yolo_thread, args=(self.cv_original_full,), daemon=True).start()
+
+    def yolo_thread(self, img_original):
+        try:
+            img = img_original # Read-only below; resize and astype allocate their own output
+            max_analysis_w = 300 
+            h, w = img.shape[:2]
+            if w > max_analysis_w:
+                scale = max_analysis_w / w
+                img = cv2.resize(img, (max_analysis_w, int(h * scale)), interpolation=cv2.INTER_AREA)
             
-        data = img.reshape((-1, 3)).astype(np.float32)
-        
-        unique_colors = np.unique(data.astype(np.uint8), axis=0)
-        final_colors = []
-        
-        if len(unique_colors) <= 64:
-            print(f"YOLO: Found {len(unique_colors)} unique colors. Using Exact.")
-            final_colors = [tuple(int(x) for x in c) for c in unique_colors]
-        else:
-            print(f"YOLO: Too many colors. Quantizing to 32.")
-            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
-            ret, label, center = cv2.kmeans(data, 32, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
-            center = np.uint8(center)
-            final_colors = [tuple(int(x) for x in c) for c in center]
+            # Pack each BGR pixel into one uint32 (B high) so a 1-D unique keeps row order
+            packed = ((img[..., 0].astype(np.uint32) << 16) | (img[..., 1].astype(np.uint32) << 8) | img[..., 2]).ravel()
+            unique_packed = np.unique(packed)
+            unique_colors = np.stack([unique_packed >> 16, (unique_packed >> 8) & 0xFF, unique_packed & 0xFF], axis=1).astype(np.uint8)
+            
+            if len(unique_colors) <= 64:
+                print(f"YOLO: Found {len(unique_colors)} unique colors. Using Exact.")
+                final_colors = unique_colors
+            else:
+                print(f"YOLO: Too many colors. Quantizing to 32.")
+                data = img.reshape((-1, 3)).astype(np.float32)
+                max_samples = 20000 # Palette centers converge the same on a random subset
+                if data.shape[0] > max_samples:
+                    data = data[np.random.default_rng().choice(data.shape[0], max_samples, replace=False)]
+                criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+                ret, label, center = cv2.kmeans(data, 32, None, criteria, 3, cv2.KMEANS_PP_CENTERS)
+                final_colors = np.uint8(center)
             
+            self._post(self._apply_yolo_result, final_colors)
+        except Exception as e:
+            print(e)
+            self._post(self.progress.stop)
+
+    def _apply_yolo_result(self, final_colors):
+        self.progress.stop()
+        self.progress['mode'] = 'determinate'
+        
         self.picked_colors = final_colors
+        self._picked_set = set(map(tuple, final_colors.tolist()))
+        self.layer_vars = []
+        self.select_vars = []
+        self._sync_var_shadows()
         self.reorder_palette_by_similarity()
         
         target_layers = self.config["max_colors"].get()
         if len(self.picked_colors) > target_layers:
             print(f"YOLO: Grouping {len(self.picked_colors)} colors into {target_layers} layers.")
-            palette_data = np.array(self.picked_colors, dtype=np.float32)
+            palette_data = self.picked_colors.astype(np.float32)
             criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
-            ret, labels, centers = cv2.kmeans(palette_data, target_layers, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
-            centers_info = []
-            for i, center in enumerate(centers):
-                centers_info.append( {'id': i, 'val': sum(center)} )
-            centers_info.sort(key=lambda x: x['val'], reverse=True)
-            cluster_to_layer_map = {}
-            for new_layer_num, info in enumerate(centers_info):
-                cluster_to_layer_map[info['id']] = new_layer_num + 1
-            for i, cluster_idx in enumerate(labels.flatten()):
-                new_layer_id = cluster_to_layer_map[cluster_idx]
-                self.layer_vars[i].set(new_layer_id)
+            ret, labels, centers = cv2.kmeans(palette_data, target_layers, None, criteria, 3, cv2.KMEANS_PP_CENTERS)
+            # Brightest cluster becomes Layer 1
+            rank = np.argsort(-centers.sum(axis=1), kind="stable")
+            cluster_to_layer = np.empty(len(centers), dtype=np.int32)
+            cluster_to_layer[rank] = np.arange(1, len(centers) + 1)
+            for var, new_layer_id in zip(self.layer_vars, cluster_to_layer[labels.ravel()].tolist()):
+                var.set(new_layer_id)
 
         self.update_pick_ui()
         self.lbl_status.config(text=f"YOLO Mode: {len(self.picked_colors)} colors grouped into {target_layers} layers.")
@@ -581,82 +811,79 @@ class CamoStudioApp:
             if y < self.cv_original_full.shape[0] and x < self.cv_original_full.shape[1]:
                 bgr_color = self.cv_original_full[y, x]
                 bgr_tuple = tuple(int(x) for x in bgr_color)
-                if bgr_tuple in self.picked_colors:
+                if bgr_tuple in self._picked_set:
                     self.lbl_status.config(text="Color already in palette.")
                     return
-                self.picked_colors.append(bgr_tuple)
+                self.picked_colors = np.vstack((self.picked_colors, bgr_color))
+                self._picked_set.add(bgr_tuple)
                 self.reorder_palette_by_similarity()
                 self.update_pick_ui()
                 self.lbl_status.config(text=f"Color added & sorted. Total: {len(self.picked_colors)}")
 
     def reorder_palette_by_similarity(self):
-        if not self.picked_colors: return
-        while len(self.layer_vars) < len(self.picked_colors):
-             existing_ids = [v.get() for v in self.layer_vars]
-             next_id = max(existing_ids) + 1 if existing_ids else 1
-             self.layer_vars.append(tk.IntVar(value=next_id))
-        while len(self.select_vars) < len(self.picked_colors):
-             self.select_vars.append(tk.BooleanVar(value=False))
-
-        groups = {}
-        for i, color in enumerate(self.picked_colors):
-            lid = self.layer_vars[i].get()
-            if lid not in groups: groups[lid] = []
-            groups[lid].append({'color': color, 'var': self.layer_vars[i], 'select': self.select_vars[i]})
-
-        group_metrics = []
-        for lid, items in groups.items():
-            avg_b = np.mean([sum(x['color']) for x in items])
-            group_metrics.append({'lid': lid, 'brightness': avg_b, 'items': items})
+        if not len(self.picked_colors): return
+        missing = len(self.picked_colors) - len(self.layer_vars)
+        if missing > 0:
+            # Each new color gets its own layer after the highest existing one
+            next_id = int(self._layer_ids.max()) + 1 if len(self._layer_ids) else 1
+            new_ids = np.arange(next_id, next_id + missing, dtype=np.int32)
+            self.layer_vars += [self._new_layer_var(int(lid)) for lid in new_ids]
+            self.select_vars += [self._new_select_var() for _ in range(missing)]
+            self._sync_var_shadows(np.concatenate((self._layer_ids, new_ids)), np.concatenate((self._select, np.zeros(missing, dtype=bool))))
+
+        colors = self.picked_colors.astype(np.int32)
+        layers = self._layer_ids
+        sums = colors.sum(axis=1)
+
+        # Group by layer id: mean color and brightness per group, first appearance breaks ties
+        _, first_idx, group = np.unique(layers, return_index=True, return_inverse=True)
+        counts = np.bincount(group)
+        group_means = np.stack([np.bincount(group, weights=colors[:, c]) for c in range(3)], axis=1) / counts[:, None]
+        group_brightness = group_means.sum(axis=1)
         
-        group_metrics.sort(key=lambda x: x['brightness'], reverse=True)
-
-        new_colors = []
-        new_layer_vars = []
-        new_select_vars = []
-        current_layer_num = 1
-        
-        for g in group_metrics:
-            items = g['items']
-            items.sort(key=lambda x: sum(x['color']), reverse=True)
-            for item in items:
-                new_colors.append(item['color'])
-                new_layer_vars.append(tk.IntVar(value=current_layer_num))
-                new_select_vars.append(item['select'])
-            current_layer_num += 1
-
-        self.picked_colors = new_colors
-        self.layer_vars = new_layer_vars
-        self.select_vars = new_select_vars
+        # Brightest group first, then each next group is the closest color to the previous one;
+        # brightest color first within each group
+        brightest = np.lexsort((first_idx, -group_brightness))[0]
+        group_rank = np.empty(len(counts), dtype=np.intp)
+        group_rank[nearest_neighbor_chain(group_means, brightest)] = np.arange(len(counts))
+        order = np.lexsort((-sums, group_rank[group]))
+        sorted_group = group[order]
+        new_ids = np.concatenate(([1], 1 + np.cumsum(sorted_group[1:] != sorted_group[:-1])))
+
+        self.picked_colors = self.picked_colors[order]
+        self.layer_vars = [self._new_layer_var(int(lid)) for lid in new_ids]
+        self.select_vars = [self.select_vars[i] for i in order]
+        self._sync_var_shadows(new_ids, self._select[order])
 
     def remove_color(self, index):
         if 0 <= index < len(self.picked_colors):
-            del self.picked_colors[index]
+            self._picked_set.discard(tuple(self.picked_colors[index].tolist()))
+            self.picked_colors = np.delete(self.picked_colors, index, axis=0)
             del self.layer_vars[index] 
             del self.select_vars[index]
+            self._sync_var_shadows(np.delete(self._layer_ids, index), np.delete(self._select, index))
             self.compact_layer_ids()
             self.update_pick_ui()
             self.lbl_status.config(text=f"Color removed. Total: {len(self.picked_colors)}")
 
     def reset_picks(self, event=None):
-        self.picked_colors = []
+        self.picked_colors = np.empty((0, 3), dtype=np.uint8)
+        self._picked_set = set()
         self.layer_vars = []
         self.select_vars = []
+        self._sync_var_shadows()
         self.last_select_index = -1
         self.update_pick_ui()
         if self.cv_original_full is not None:
-            for tab in self.notebook.tabs():
-                if tab != str(self.tab_main): self.notebook.forget(tab)
+            self._clear_result_tabs()
 
     def apply_bulk_layer(self):
         target = self.bulk_target_layer.get()
-        changed = False
-        for i, var in enumerate(self.select_vars):
-            if var.get():
-                self.layer_vars[i].set(target)
-                changed = True
-                var.set(False) 
-        if changed:
+        selected = np.flatnonzero(self._select)
+        for i in selected:
+            self.layer_vars[i].set(target)
+            self.select_vars[i].set(False) 
+        if len(selected):
             self.compact_layer_ids()
             self.update_pick_ui()
             self.lbl_status.config(text="Bulk assignment complete. Layers re-numbered.")
@@ -664,10 +891,10 @@ class CamoStudioApp:
             messagebox.showinfo("Info", "No colors selected.")
 
     def compact_layer_ids(self):
-        current_ids = sorted(list(set(v.get() for v in self.layer_vars)))
-        id_map = {old: new+1 for new, old in enumerate(current_ids)}
-        for var in self.layer_vars:
-            var.set(id_map[var.get()])
+        # Renumber to 1..n keeping order (e.g. 2, 5, 5, 9 -> 1, 2, 2, 3)
+        new_ids = np.unique(self._layer_ids, return_inverse=True)[1] + 1
+        for i in np.flatnonzero(new_ids != self._layer_ids):
+            self.layer_vars[i].set(int(new_ids[i]))
 
     def handle_click_selection(self, index, event):
         if event and (event.state & 0x0001): # Shift Key Held
@@ -682,7 +909,7 @@ class CamoStudioApp:
     def update_pick_ui(self):
         for widget in self.swatch_list_frame.winfo_children():
             widget.destroy()
-        if not self.picked_colors:
+        if not len(self.picked_colors):
             tk.Label(self.swatch_list_frame, text="Auto-Mode", bg="#f0f0f0").pack(pady=10)
             return
         h_frame = tk.Frame(self.swatch_list_frame, bg="#f0f0f0")
@@ -692,11 +919,12 @@ class CamoStudioApp:
         btn_sort = tk.Button(h_frame, text="Resort", command=lambda: [self.reorder_palette_by_similarity(), self.update_pick_ui()], font=("Arial", 7), padx=2, pady=0)
         btn_sort.pack(side=tk.RIGHT, padx=2)
         tk.Label(h_frame, text="Layer #", bg="#f0f0f0", font=("Arial", 8, "bold")).pack(side=tk.RIGHT, padx=2)
-        for i, bgr in enumerate(self.picked_colors):
+        bright = is_bright(self.picked_colors)
+        for i, bgr in enumerate(self.picked_colors.tolist()):
             var = self.layer_vars[i]
             sel_var = self.select_vars[i]
             hex_c = bgr_to_hex(bgr)
-            fg = "black" if is_bright(bgr) else "white"
+            fg = "black" if bright[i] else "white"
             f = tk.Frame(self.swatch_list_frame, bg=hex_c, height=30, highlightthickness=1, highlightbackground="#999")
             f.pack(fill="x", padx=5, pady=2)
             f.pack_propagate(False) 
@@ -718,193 +946,212 @@ class CamoStudioApp:
         self.progress['mode'] = 'indeterminate'
         self.progress.start(10)
         
-        # Snapshot config to avoid thread safety issues
-        snapshot_config = {
-            "max_width": self.config["max_width"].get(),
-            "max_colors": self.config["max_colors"].get(),
-            "denoise_strength": self.config["denoise_strength"].get(),
-            "min_blob_size": self.config["min_blob_size"].get(),
-            "orphaned_blobs": self.config["orphaned_blobs"].get()
-        }
+        # Snapshot config to avoid thread safety issues (from the trace-kept mirrors, no Tcl reads)
+        snapshot_config = dict(self._config_values)
         
         # Snapshot lists
-        snapshot_colors = list(self.picked_colors)
-        snapshot_layers = [v.get() for v in self.layer_vars]
+        snapshot_colors = self.picked_colors.copy()
+        snapshot_layers = self._layer_ids.tolist()
         
         threading.Thread(target=self.process_thread, args=(self.cv_original_full, snapshot_config, snapshot_colors, snapshot_layers)).start()
 
     def process_thread(self, img_original, config, picked_colors, layer_ids):
         try:
-            img = img_original.copy()
             max_w = config["max_width"]
-            h, w = img.shape[:2]
-            if max_w and w > max_w:
-                scale = max_w / w
-                img = cv2.resize(img, (max_w, int(h * scale)), interpolation=cv2.INTER_AREA)
-
             denoise_val = config["denoise_strength"]
-            if denoise_val > 0:
-                k = denoise_val if denoise_val % 2 == 1 else denoise_val + 1
-                img = cv2.GaussianBlur(img, (k, k), 0)
+
+            # Resize + blur only depend on these and the source; palette / layer / blob edits reuse the last result
+            key = (max_w, denoise_val)
+            cached = self._preproc_cache
+            if cached is not None and cached[0] == key and cached[1] is img_original:
+                img = cached[2]
+            else:
+                img = img_original
+                h, w = img.shape[:2]
+                if max_w and w > max_w:
+                    scale = max_w / w
+                    img = cv2.resize(img, (max_w, int(h * scale)), interpolation=cv2.INTER_AREA)
+
+                if denoise_val > 0:
+                    k = denoise_val if denoise_val % 2 == 1 else denoise_val + 1
+                    img = cv2.GaussianBlur(img, (k, k), 0)
+                self._preproc_cache = (key, img_original, img) # img is only read from here on
 
             h, w = img.shape[:2]
-            data = img.reshape((-1, 3)).astype(np.float32)
 
-            raw_masks = []
             raw_centers = []
             
             # 1. Determine Colors (Auto vs Manual)
             if len(picked_colors) > 0:
-                centers = np.array(picked_colors, dtype=np.float32)
-                distances = np.zeros((data.shape[0], len(centers)), dtype=np.float32)
-                for i, center in enumerate(centers):
-                    distances[:, i] = np.sum((data - center) ** 2, axis=1)
-                labels_reshaped = np.argmin(distances, axis=1).reshape((h, w))
+                centers = picked_colors.astype(np.float32)
+                labels_reshaped = assign_nearest_color(img.reshape((-1, 3)), centers).reshape((h, w))
                 raw_centers = np.uint8(centers)
                 num_raw_colors = len(centers)
             else:
                 max_k = config["max_colors"]
+                pixels = img.reshape((-1, 3))
+                sample = pixels
+                max_samples = 50000 # Fit centers on a sample, then label every pixel once
+                if pixels.shape[0] > max_samples:
+                    sample = pixels[np.random.default_rng().choice(pixels.shape[0], max_samples, replace=False)]
                 criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
-                ret, label, center = cv2.kmeans(data, max_k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+                ret, label, center = cv2.kmeans(sample.astype(np.float32), max_k, None, criteria, 3, cv2.KMEANS_PP_CENTERS)
                 raw_centers = np.uint8(center)
-                labels_reshaped = label.flatten().reshape((h, w))
+                labels_reshaped = assign_nearest_color(pixels, center).reshape((h, w))
                 num_raw_colors = len(raw_centers)
 
-            # 2. Generate Raw Masks
-            for i in range(num_raw_colors):
-                mask = cv2.inRange(labels_reshaped, i, i)
-                raw_masks.append(mask)
-
-            final_masks = []
-            final_centers = []
-            total_coverage_mask = np.zeros((h, w), dtype=np.uint8) # Accumulator for optimization
-            
             min_blob = config["min_blob_size"]
             kernel = None
             if denoise_val > 0:
-                kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (denoise_val, denoise_val))
+                # A rect kernel is separable (row + column passes); an ellipse needs the full 2D scan
+                shape = cv2.MORPH_ELLIPSE if config["round_kernel"] else cv2.MORPH_RECT
+                kernel = cv2.getStructuringElement(shape, (denoise_val, denoise_val))
 
-            # 3. Merge & Filter Layers
+            # 2. Merge & Filter Layers
             if len(picked_colors) > 0:
-                # Group by Layer ID
-                layer_map = {} 
-                for idx, lid in enumerate(layer_ids):
-                    if lid not in layer_map: layer_map[lid] = []
-                    layer_map[lid].append(idx)
+                # Group by Layer ID: color index -> position of its layer in sorted order
+                sorted_layer_ids, layer_lut = np.unique(np.asarray(layer_ids), return_inverse=True)
+                num_layers = len(sorted_layer_ids)
                 
-                sorted_layer_ids = sorted(layer_map.keys())
+                # Layer color = mean of its member colors
+                color_sums = np.zeros((num_layers, 3), dtype=np.float32)
+                np.add.at(color_sums, layer_lut, raw_centers)
+                counts = np.bincount(layer_lut, minlength=num_layers).astype(np.float32)
+                final_centers = list((color_sums / counts[:, None]).astype(np.uint8))
                 
-                for lid in sorted_layer_ids:
-                    indices = layer_map[lid]
-                    combined_mask = np.zeros((h, w), dtype=np.uint8)
-                    avg_color = np.zeros(3, dtype=np.float32)
-                    
-                    for idx in indices:
-                        combined_mask = cv2.bitwise_or(combined_mask, raw_masks[idx])
-                        avg_color += raw_centers[idx]
-                    
-                    avg_color = (avg_color / len(indices)).astype(np.uint8)
-                    
-                    if kernel is not None:
-                        combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel)
-                        combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel)
-                    
-                    # Optimize: Use raster filtering instead of vector filtering
-                    filtered = filter_small_blobs(combined_mask, min_blob)
-                    final_masks.append(filtered)
-                    final_centers.append(avg_color)
-                    
-                    # Accumulate coverage
-                    total_coverage_mask = cv2.bitwise_or(total_coverage_mask, filtered)
-
+                # Relabel pixels by output layer in one gather, so each layer's mask is one
+                # inRange pass instead of OR-ing together a mask per member color
+                layer_lut = layer_lut.astype(np.uint8 if num_layers <= 256 else np.int32)
+                layer_labels = layer_lut[labels_reshaped]
             else:
-                # Auto Mode
-                for i, mask in enumerate(raw_masks):
-                    if kernel is not None:
-                        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-                        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-                    
-                    filtered = filter_small_blobs(mask, min_blob)
-                    final_masks.append(filtered)
-                    
-                    # Accumulate coverage
-                    total_coverage_mask = cv2.bitwise_or(total_coverage_mask, filtered)
-                final_centers = raw_centers
+                # Auto Mode: every cluster is its own layer
+                num_layers = num_raw_colors
+                layer_labels = labels_reshaped
+                final_centers = list(raw_centers)
+
+            # One scratch image per worker thread (layers run concurrently, so it can't be shared);
+            # morphology ping-pongs between it and the layer's own mask instead of allocating
+            scratch = threading.local()
 
-            # 4. Orphaned Blobs (Optimized)
+            def clean_layer(j):
+                mask = cv2.inRange(layer_labels, j, j)
+                if kernel is not None:
+                    tmp = getattr(scratch, "buf", None)
+                    if tmp is None: tmp = scratch.buf = np.empty((h, w), dtype=np.uint8)
+                    cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, dst=tmp)
+                    cv2.morphologyEx(tmp, cv2.MORPH_OPEN, kernel, dst=mask)
+                # Optimize: Use raster filtering instead of vector filtering
+                return filter_small_blobs(mask, min_blob)
+
+            # Layers are independent and OpenCV releases the GIL, so clean them in parallel
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+                final_masks = list(pool.map(clean_layer, range(num_layers)))
+            
+            # 3. Orphaned Blobs (Optimized)
             if config["orphaned_blobs"]:
-                orphans = cv2.bitwise_not(total_coverage_mask)
+                # Coverage is only needed here; OR in place rather than allocating per layer
+                total_coverage_mask = np.zeros((h, w), dtype=np.uint8)
+                for filtered in final_masks:
+                    cv2.bitwise_or(total_coverage_mask, filtered, dst=total_coverage_mask)
+                orphans = cv2.bitwise_not(total_coverage_mask, dst=total_coverage_mask)
                 
                 if kernel is not None:
-                    orphans = cv2.morphologyEx(orphans, cv2.MORPH_OPEN, kernel)
-                    orphans = cv2.morphologyEx(orphans, cv2.MORPH_CLOSE, kernel)
+                    tmp = np.empty_like(orphans)
+                    cv2.morphologyEx(orphans, cv2.MORPH_OPEN, kernel, dst=tmp)
+                    cv2.morphologyEx(tmp, cv2.MORPH_CLOSE, kernel, dst=orphans)
 
                 orphans_final = filter_small_blobs(orphans, min_blob)
 
                 if cv2.countNonZero(orphans_final) > 0:
-                    # Safety break for color picking to avoid infinite loop
-                    attempts = 0
-                    rand_c = np.array([0, 255, 0], dtype=np.uint8) # Default green if search fails
-                    
-                    while attempts < 50:
-                        attempts += 1
-                        candidate = np.random.randint(0, 256, 3).astype(np.uint8)
-                        dists = [np.sum((c - candidate)**2) for c in final_centers]
-                        
-                        # Adaptive threshold: if crowded (many layers), accept lower contrast
-                        threshold = 2000 if len(final_centers) < 10 else 500
-                        
-                        if not dists or min(dists) > threshold: 
-                            rand_c = candidate
-                            break
+                    # Farthest-point pick: of a batch of random candidates, take the one whose
+                    # nearest layer color is farthest away (int32 so differences can't wrap)
+                    candidates = np.random.randint(0, 256, (256, 3)).astype(np.int32)
+                    layer_colors = np.array(final_centers, dtype=np.int32).reshape(-1, 3)
+                    dists = ((candidates[:, None, :] - layer_colors[None, :, :]) ** 2).sum(-1)
+                    min_dists = dists.min(axis=1, initial=3 * 255 ** 2) # initial covers zero layers
+                    rand_c = candidates[min_dists.argmax()].astype(np.uint8)
                     
                     final_masks.append(orphans_final)
                     final_centers.append(rand_c)
                     print("Added Orphaned Blobs layer.")
 
+            # Layer index shown at each pixel (later layers on top); len(masks) = background
+            final_label_map = np.full((h, w), len(final_masks), dtype=np.uint16)
+            for i, mask in enumerate(final_masks):
+                final_label_map[mask == 255] = i
+
             self.processed_data = {
                 "centers": final_centers,
                 "masks": final_masks,
                 "width": w,
                 "height": h
             }
-            self.root.after(0, lambda: self._generate_previews(final_centers, final_masks, w, h))
-            self.root.after(0, self.update_ui_after_process)
+            self._post(self._generate_previews, final_centers, final_label_map)
+            self._post(self.update_ui_after_process)
 
         except Exception as e:
             print(e)
-            self.root.after(0, self.progress.stop)
-
-    def _generate_previews(self, centers, masks, w, h):
-        combined = np.ones((h, w, 3), dtype=np.uint8) * 255
-        for i, mask in enumerate(masks):
-            combined[mask == 255] = centers[i]
-        self.preview_images["All"] = Image.fromarray(cv2.cvtColor(combined, cv2.COLOR_BGR2RGB))
-        for i, mask in enumerate(masks):
-            layer = np.ones((h, w, 3), dtype=np.uint8) * 255
-            layer[mask == 255] = centers[i]
-            self.preview_images[i] = Image.fromarray(cv2.cvtColor(layer, cv2.COLOR_BGR2RGB))
+            self._post(self.progress.stop)
+
+    @staticmethod
+    def _preview_palette(centers):
+        """ RGB palette with white appended for background, so each preview is a single gather. """
+        return np.vstack([np.asarray(centers, dtype=np.uint8).reshape(-1, 3)[:, ::-1], [255, 255, 255]]).astype(np.uint8)
+
+    def _generate_previews(self, centers, label_map):
+        # Fresh dict: a re-run with fewer layers must not keep the old run's extra images alive.
+        # Only the combined view is built now; layer previews wait until their tab is opened.
+        self._preview_cache = {"All": Image.fromarray(self._preview_palette(centers)[label_map])}
+
+    def _get_layer_preview(self, i):
+        """ Builds (once) the preview of a single layer: its color on white. """
+        img = self._preview_cache.get(i)
+        if img is None:
+            palette_rgb = self._preview_palette(self.processed_data["centers"])
+            mask = self.processed_data["masks"][i]
+            img = Image.fromarray(np.take(palette_rgb[[-1, i]], mask >> 7, axis=0)) # 0 -> white, 255 -> color
+            self._preview_cache[i] = img
+        return img
 
     def update_ui_after_process(self):
         self.progress.stop()
         self.progress['mode'] = 'determinate'
         self.progress_var.set(100)
         self.lbl_status.config(text="Processing Complete.")
-        for tab in self.notebook.tabs():
-            if tab != str(self.tab_main): self.notebook.forget(tab)
-        self._add_tab("Combined Result", self.preview_images["All"])
+        self._clear_result_tabs()
+        self._add_tab("Combined Result", self._preview_cache["All"])
         centers = self.processed_data["centers"]
         for i in range(len(centers)):
             hex_c = bgr_to_hex(centers[i])
-            self._add_tab(f"L{i+1} {hex_c}", self.preview_images[i])
+            self._add_tab(f"L{i+1} {hex_c}", layer=i)
         self.notebook.select(1)
 
-    def _add_tab(self, title, pil_image):
+    def _clear_result_tabs(self):
+        """ Removes result tabs and destroys them, releasing their canvases' PhotoImages. """
+        for tab in self.notebook.tabs():
+            if tab != str(self.tab_main):
+                self.notebook.forget(tab)
+                self.notebook.nametowidget(tab).destroy()
+        self._lazy_tabs = {}
+        self._contour_cache = {}
+
+    def _add_tab(self, title, pil_image=None, layer=None):
+        """ Adds a result tab; with `layer` the preview canvas is deferred until the tab is shown. """
         frame = tk.Frame(self.notebook, bg="#333")
         self.notebook.add(frame, text=title)
+        if layer is not None:
+            self._lazy_tabs[str(frame)] = layer
+            return
         canvas = AutoResizingCanvas(frame, pil_image=pil_image, bg="#333", highlightthickness=0)
         canvas.pack(fill="both", expand=True)
 
+    def _on_tab_changed(self, event=None):
+        layer = self._lazy_tabs.pop(self.notebook.select(), None)
+        if layer is None: return
+        frame = self.notebook.nametowidget(self.notebook.select())
+        canvas = AutoResizingCanvas(frame, pil_image=self._get_layer_preview(layer), bg="#333", highlightthickness=0)
+        canvas.pack(fill="both", expand=True)
+
     def export_bundle_2d(self, event=None):
         if not self.processed_data: return
         # Update directory from dialog
@@ -916,6 +1163,34 @@ class CamoStudioApp:
         self.progress_var.set(0)
         threading.Thread(target=self.export_2d_thread, args=(target_dir,)).start()
 
+    def _get_simplified_polys(self, mask_id, mask, smooth):
+        """
+        Traces a layer mask (full nesting tree) and simplifies every contour once.
+        Returns (contours, hierarchy, depth, approximated). depth[j] is 0 for outermost
+        shapes; even depths are outer borders, odd depths are holes. approximated[j] is
+        an (N, 2) point array, or None if the contour collapses below 3 points.
+        """
+        key = (mask_id, smooth)
+        entry = self._contour_cache.get(key)
+        if entry is not None and entry[0] is mask: return entry[1]
+        contours, hierarchy = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        hierarchy = hierarchy[0] if hierarchy is not None else np.empty((0, 4), dtype=np.int32)
+        depth = np.zeros(len(contours), dtype=np.int32)
+        for j in range(len(contours)):
+            parent = hierarchy[j][3]
+            while parent != -1:
+                depth[j] += 1
+                parent = hierarchy[parent][3]
+        approximated = []
+        for c in contours:
+            arc = cv2.arcLength(c, True)
+            approx = cv2.approxPolyDP(c, smooth * arc, True)
+            approximated.append(approx.reshape(-1, 2) if len(approx) >= 3 else None)
+        result = (contours, hierarchy, depth, approximated)
+        # Holding the mask keeps its id from being reused by a later run's mask
+        self._contour_cache[key] = (mask, result)
+        return result
+
     def export_2d_thread(self, target_dir):
         try:
             centers = self.processed_data["centers"]
@@ -926,7 +1201,7 @@ class CamoStudioApp:
             smooth = self.config["smoothing"].get() 
             
             for i in range(len(centers)):
-                self.progress_var.set(((i+1)/len(centers))*100)
+                self._post(self.progress_var.set, ((i+1)/len(centers))*100)
                 bgr = centers[i]
                 hex_c = bgr_to_hex(bgr)
                 fname = tmpl.replace("%INPUTFILENAME%", self.current_base_name).replace("%COLOR%", hex_c.replace("#","")).replace("%INDEX%", str(i+1))
@@ -934,24 +1209,20 @@ class CamoStudioApp:
                 path = os.path.join(target_dir, fname)
                 
                 dwg = svgwrite.Drawing(path, profile='tiny', size=(width, height))
-                contours, _ = cv2.findContours(masks[i], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                for c in contours:
-                    epsilon = smooth * cv2.arcLength(c, True)
-                    approx = cv2.approxPolyDP(c, epsilon, True)
-                    if len(approx) < 3: continue
-                    pts = approx.squeeze().tolist()
-                    if not pts: continue
-                    if isinstance(pts[0], int): d = f"M {pts[0]},{pts[1]} "
-                    else:
-                        d = f"M {pts[0][0]},{pts[0][1]} "
-                        for p in pts[1:]: d += f"L {p[0]},{p[1]} "
+                _, _, depth, approximated = self._get_simplified_polys(id(masks[i]), masks[i], smooth)
+                for j, approx in enumerate(approximated):
+                    # Outermost contours only (what RETR_EXTERNAL gives); paths are filled solid
+                    if depth[j] != 0 or approx is None: continue
+                    pts = approx.tolist()
+                    d = f"M {pts[0][0]},{pts[0][1]} "
+                    for p in pts[1:]: d += f"L {p[0]},{p[1]} "
                     d += "Z "
                     dwg.add(dwg.path(d=d, fill=hex_c, stroke='none'))
                 dwg.save()
-            self.root.after(0, lambda: messagebox.showinfo("Success", "2D Export Complete"))
+            self._post(messagebox.showinfo, "Success", "2D Export Complete")
         except Exception as e:
             print(e)
-            self.root.after(0, lambda: messagebox.showerror("Error", str(e)))
+            self._post(messagebox.showerror, "Error", str(e))
 
     def apply_stencil_bridges(self, polys, bridge_width):
         """
@@ -970,24 +1241,23 @@ class CamoStudioApp:
                 continue
 
             # It has holes! We need to anchor the islands inside.
-            temp_poly = poly
-            
+            bridge_lines = []
             for interior in poly.interiors:
                 # 1. Find the shortest distance between the inner island and the outer frame
-                p1, p2 = nearest_points(temp_poly.exterior, interior)
+                p1, p2 = nearest_points(poly.exterior, interior)
                 
                 # 2. Create a line connecting them
-                bridge_line = LineString([p1, p2])
-                
-                # 3. Thicken the line into a rectangle (The Bridge)
-                bridge_shape = bridge_line.buffer(bridge_width / 2)
-                
-                # 4. Subtract the bridge from the polygon (Cutting the ring)
-                try:
-                    temp_poly = temp_poly.difference(bridge_shape)
-                    if not temp_poly.is_valid: temp_poly = temp_poly.buffer(0)
-                except Exception as e:
-                    print(f"Bridge failed on one island: {e}")
+                bridge_lines.append(LineString([p1, p2]))
+            
+            # 3. Thicken all lines into rectangles (The Bridges) in one go
+            # 4. Subtract them from the polygon in a single cut, instead of one difference per island
+            temp_poly = poly
+            try:
+                all_bridges = unary_union(bridge_lines).buffer(bridge_width / 2)
+                temp_poly = poly.difference(all_bridges)
+                if not temp_poly.is_valid: temp_poly = temp_poly.buffer(0)
+            except Exception as e:
+                print(f"Bridge failed: {e}")
             
             # Handle case where difference returns a MultiPolygon (if we cut it in half)
             if isinstance(temp_poly, MultiPolygon):
@@ -1016,7 +1286,7 @@ class CamoStudioApp:
             target_h = orig_h * scale
             
             for i in range(len(centers)):
-                self.progress_var.set(((i+1)/len(centers))*100)
+                self._post(self.progress_var.set, ((i+1)/len(centers))*100)
                 bgr = centers[i]
                 hex_c = bgr_to_hex(bgr)
                 
@@ -1025,30 +1295,28 @@ class CamoStudioApp:
                 fname += ".stl"
                 full_path = os.path.join(target_dir, fname)
                 
-                contours, hierarchy = cv2.findContours(masks[i], cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+                _, hierarchy, depth, approximated = self._get_simplified_polys(id(masks[i]), masks[i], smooth)
                 shapely_polys = []
                 
-                if hierarchy is not None:
-                    hierarchy = hierarchy[0]
-                    for j, c in enumerate(contours):
-                        if hierarchy[j][3] == -1: 
-                            epsilon = smooth * cv2.arcLength(c, True)
-                            approx = cv2.approxPolyDP(c, epsilon, True)
-                            if len(approx) < 3: continue
-                            
-                            outer_pts = approx.squeeze() * scale
-                            outer_pts[:, 1] = target_h - outer_pts[:, 1] 
+                # Scale + Y-flip every kept contour in one pass, then split back per contour
+                kept = [j for j, approx in enumerate(approximated) if approx is not None]
+                world_pts = [None] * len(approximated)
+                if kept:
+                    all_pts = np.concatenate([approximated[j] for j in kept]) * scale
+                    all_pts[:, 1] = target_h - all_pts[:, 1]
+                    bounds = np.cumsum([len(approximated[j]) for j in kept[:-1]])
+                    for j, pts in zip(kept, np.split(all_pts, bounds)): world_pts[j] = pts
+                
+                if len(hierarchy):
+                    for j, outer_pts in enumerate(world_pts):
+                        if depth[j] % 2 == 0: # Outer border; its direct children are its holes
+                            if outer_pts is None: continue
                             
                             holes = []
                             current_child_idx = hierarchy[j][2]
                             while current_child_idx != -1:
-                                child_c = contours[current_child_idx]
-                                eps_child = smooth * cv2.arcLength(child_c, True)
-                                approx_child = cv2.approxPolyDP(child_c, eps_child, True)
-                                if len(approx_child) >= 3:
-                                    hole_pts = approx_child.squeeze() * scale
-                                    hole_pts[:, 1] = target_h - hole_pts[:, 1]
-                                    holes.append(hole_pts)
+                                hole_pts = world_pts[current_child_idx]
+                                if hole_pts is not None: holes.append(hole_pts)
                                 current_child_idx = hierarchy[current_child_idx][0]
                             
                             try:
@@ -1065,7 +1333,9 @@ class CamoStudioApp:
                          shapely_polys = self.apply_stencil_bridges(shapely_polys, bridge_w)
                 # ----------------------------------
 
-                scene_mesh = trimesh.Trimesh()
+                # Collect the extruded parts and join them once at the end; `+=` would
+                # re-concatenate everything built so far on every part
+                mesh_parts = []
 
                 if is_stencil:
                     min_x, min_y = -border_w, -border_w
@@ -1089,8 +1359,7 @@ class CamoStudioApp:
                     for p in polys_to_extrude:
                         if not p.is_valid: p = p.buffer(0)
                         if p.is_empty: continue
-                        mesh_part = trimesh.creation.extrude_polygon(p, height=extrusion)
-                        scene_mesh += mesh_part
+                        mesh_parts.append(trimesh.creation.extrude_polygon(p, height=extrusion))
 
                 else:
                     if shapely_polys:
@@ -1104,28 +1373,27 @@ class CamoStudioApp:
                         for p in polys_to_extrude:
                             if not p.is_valid: p = p.buffer(0)
                             if p.is_empty: continue
-                            mesh_part = trimesh.creation.extrude_polygon(p, height=extrusion)
-                            scene_mesh += mesh_part
+                            mesh_parts.append(trimesh.creation.extrude_polygon(p, height=extrusion))
 
                     if border_w > 0:
                         outer_box = [[-border_w, -border_w], [target_w + border_w, -border_w],
                                      [target_w + border_w, target_h + border_w], [-border_w, target_h + border_w]]
                         inner_box = [[0, 0], [target_w, 0], [target_w, target_h], [0, target_h]]
                         border_poly = Polygon(shell=outer_box, holes=[inner_box])
-                        border_mesh = trimesh.creation.extrude_polygon(border_poly, height=extrusion)
-                        scene_mesh += border_mesh
+                        mesh_parts.append(trimesh.creation.extrude_polygon(border_poly, height=extrusion))
 
+                scene_mesh = trimesh.util.concatenate(mesh_parts) if mesh_parts else trimesh.Trimesh()
                 if not scene_mesh.is_empty:
                     scene_mesh.export(full_path)
             
-            self.root.after(0, lambda: messagebox.showinfo("Success", f"Exported 3D models to {target_dir}"))
-            self.root.after(0, lambda: self.lbl_status.config(text="3D Export Complete."))
+            self._post(messagebox.showinfo, "Success", f"Exported 3D models to {target_dir}")
+            self._post(self.lbl_status.config, text="3D Export Complete.")
             
         except Exception as e:
             print(e)
             err_msg = str(e)
-            self.root.after(0, lambda: messagebox.showerror("Export Error", err_msg))
-            self.root.after(0, self.progress.stop)
+            self._post(messagebox.showerror, "Export Error", err_msg)
+            self._post(self.progress.stop)
 
 if __name__ == "__main__":
     root = tk.Tk()